@@ -176,9 +176,7 @@ class OLEDeepParser(object):
             self.current_section = None
         else:
             self.current_section = None
-            unknown_guid = ""
-            for c in section_index_field.value:
-                unknown_guid += f"{hex(ord(c))} "
+            unknown_guid = "".join(f"{hex(ord(c))} " for c in section_index_field.value)
 
             self.log.warning(f"Unknown_guid: {unknown_guid} {self.task.sid}/{self.task.sha256}")
 
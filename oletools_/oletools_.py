@@ -6,11 +6,10 @@ Assemblyline service using the oletools library to analyze OLE and OOXML files.
 from __future__ import annotations
 
 import binascii
-import email
-import gzip
 import hashlib
 import json
 import logging
+import mmap
 import os
 import re
 import socket
@@ -19,11 +18,10 @@ import zipfile
 import zlib
 from collections import defaultdict
 from datetime import datetime
-from io import BytesIO
-from ipaddress import AddressValueError, IPv4Address
 from itertools import chain, groupby
 from pathlib import PureWindowsPath
 from typing import IO, TYPE_CHECKING, Any, ClassVar, Literal
+from unittest.mock import patch
 from urllib.parse import unquote, urlsplit
 
 import magic
@@ -41,24 +39,23 @@ from assemblyline_v4_service.common.base import ServiceBase
 from assemblyline_v4_service.common.result import BODY_FORMAT, Heuristic, Result, ResultKeyValueSection, ResultSection
 from assemblyline_v4_service.common.task import MaxExtractedExceeded
 from lxml import etree
-from signify.authenticode import RawCertificateFile
 
 from oletools import mraptor, msodde, oleid, oleobj, olevba, rtfobj
 from oletools.common import clsid
-from oletools.thirdparty.xxxswf import xxxswf
+from oletools.common.log_helper import log_helper
 from oletools_.cleaver import OLEDeepParser
-from oletools_.signatures import describe_signed_data
+from oletools_.signatures import describe_signature
 from oletools_.stream_parser import PowerPointDoc
 
 if TYPE_CHECKING:
-    from collections.abc import Iterable, Mapping
+    from collections.abc import Iterable, Iterator, Mapping
 
     from assemblyline_v4_service.common.request import ServiceRequest
 
 # Type definition for tags
 Tags = dict[str, list[str]]
 
-AUTO_EXEC = set(chain(*(x for x in olevba.AUTOEXEC_KEYWORDS.values())))
+AUTO_EXEC = frozenset().union(*olevba.AUTOEXEC_KEYWORDS.values())
 
 
 def collate_tags(tags_list: Iterable[Tags]) -> Tags:
@@ -69,23 +66,93 @@ def collate_tags(tags_list: Iterable[Tags]) -> Tags:
     return {_type: list(tag_set) for _type, tag_set in collated.items()}
 
 
-def tag_contains_match(tag: str, matches: list[str]) -> bool:
-    """Check if the tag contains any of the matches."""
-    return any(match.lower() == tag.lower() for match in matches)
-
-
 def regex_matches_tag(tag: str, regexes: list[str]) -> bool:
     """Check if any of the regexes match the tag."""
     return any(re.match(regex, tag, re.IGNORECASE) for regex in regexes)
 
 
-def is_safelisted(
-    tag_type: str, tag: str, safelist_matches: Mapping[str, list[str]], safelist_regexes: Mapping[str, list[str]]
-) -> bool:
-    """Check if the tag is safelisted by either a match or a regex."""
-    return tag_contains_match(tag, safelist_matches.get(tag_type, [])) or regex_matches_tag(
-        tag, safelist_regexes.get(tag_type, [])
+def compile_safelist_regexes(regexes: list[str]) -> list[re.Pattern[str]]:
+    """Compile safelist regexes, combining them into a single pattern where possible so a tag is checked with one match.
+
+    Regexes with groups are compiled on their own, as combining them would renumber the groups their backreferences
+    refer to. Regexes that can't be combined (e.g. using global inline flags) are also compiled on their own and
+    invalid regexes, which could never match, are skipped.
+    """
+    combinable: list[re.Pattern[str]] = []
+    separate: list[re.Pattern[str]] = []
+    for regex in regexes:
+        try:
+            pattern = re.compile(regex, re.IGNORECASE)
+        except re.error:
+            continue
+        (separate if pattern.groups else combinable).append(pattern)
+    if len(combinable) > 1:
+        try:
+            combinable = [re.compile("|".join(f"(?:{pattern.pattern})" for pattern in combinable), re.IGNORECASE)]
+        except re.error:
+            pass
+    return combinable + separate
+
+
+MIME_HEADERS_END_RE = re.compile(rb"(?:^|\r?\n)\r?\n")
+MIME_FOLDED_LINE_RE = re.compile(rb"\r?\n[ \t]+")
+# Only a boundary parameter (after a ';' separator), not any parameter whose name ends in boundary
+MIME_BOUNDARY_RE = re.compile(rb';\s*boundary\s*=\s*(?:"([^"]+)"|([^\s;]+))', re.IGNORECASE)
+MIME_FILENAME_RE = re.compile(rb'\bfilename\s*=\s*(?:"([^"]*)"|([^\s;]+))', re.IGNORECASE)
+MIME_NAME_RE = re.compile(rb'\bname\s*=\s*(?:"([^"]*)"|([^\s;]+))', re.IGNORECASE)
+# Multiparts nested deeper than this are yielded as a single part
+MIME_MAX_DEPTH = 32
+
+
+def parse_mime_headers(header_block: bytes) -> dict[bytes, bytes]:
+    """Parse MIME headers into a dictionary of lowercase header name to value (first occurrence only)."""
+    headers: dict[bytes, bytes] = {}
+    for line in MIME_FOLDED_LINE_RE.sub(b" ", header_block).splitlines():
+        name, sep, value = line.partition(b":")
+        if sep:
+            headers.setdefault(name.strip().lower(), value.strip())
+    return headers
+
+
+def iter_mime_parts(data: bytes, depth: int = 0) -> Iterator[tuple[dict[bytes, bytes], bytes]]:
+    """Iterate over the (non-multipart) parts of a MIME message.
+
+    A lightweight alternative to email.message_from_bytes(data).walk() that only splits the data on
+    the multipart boundaries and parses the headers of each part.
+
+    Args:
+        data: The MIME message.
+        depth: The nesting depth of the message, multiparts past MIME_MAX_DEPTH aren't split.
+
+    Yields:
+        The headers (see parse_mime_headers) and the undecoded body of each part.
+    """
+    headers_end = MIME_HEADERS_END_RE.search(data)
+    if headers_end is None:
+        headers, body = parse_mime_headers(data), b""
+    else:
+        headers, body = parse_mime_headers(data[: headers_end.start()]), data[headers_end.end() :]
+    content_type = headers.get(b"content-type", b"")
+    boundary = MIME_BOUNDARY_RE.search(content_type)
+    if boundary is None or not content_type.lower().startswith(b"multipart/") or depth >= MIME_MAX_DEPTH:
+        yield headers, body
+        return
+    # Like the email feedparser, only whole lines holding the boundary (and optional trailing whitespace) delimit parts
+    delimiter_re = re.compile(
+        rb"^--" + re.escape(boundary.group(1) or boundary.group(2)) + rb"(--)?[ \t]*\r?$", re.MULTILINE
     )
+    # The data before the first delimiter is the preamble
+    part_start = None
+    for delimiter in delimiter_re.finditer(body):
+        if part_start is not None:
+            yield from iter_mime_parts(body[part_start : delimiter.start()], depth + 1)
+        if delimiter.group(1):
+            break  # Closing delimiter
+        # Skip the line break of the delimiter line
+        part_start = delimiter.end() + 1
+    else:
+        if part_start is not None:
+            yield from iter_mime_parts(body[part_start:], depth + 1)
 
 
 class Oletools(ServiceBase):
@@ -99,6 +166,11 @@ class Oletools(ServiceBase):
     MAX_XML_SCAN_CHARS = 500_000
     MIN_MACRO_SECTION_SCORE = 50
     LARGE_MALFORMED_BYTES = 5000
+    # Limits of each result cache, in entries and in total length of the cached text
+    RESULT_CACHE_SIZE = 16
+    RESULT_CACHE_BYTES = 16 * 1024 * 1024
+    # Everything outside of printable ASCII, for stripping with bytes.translate
+    NON_PRINTABLE_BYTES = bytes(i for i in range(256) if not 31 < i < 127)
 
     METADATA_TO_TAG: ClassVar[dict[str, str]] = {
         "title": "file.ole.summary.title",
@@ -116,6 +188,7 @@ class Oletools(ServiceBase):
 
     # In addition to those from olevba.py
     ADDITIONAL_SUSPICIOUS_KEYWORDS = ("WinHttp", "WinHttpRequest", "WinInet", 'Lib "kernel32" Alias')
+    ADDITIONAL_SUSPICIOUS_KEYWORDS_LOWER = tuple(keyword.lower() for keyword in ADDITIONAL_SUSPICIOUS_KEYWORDS)
 
     # Suspicious keywords for dde links
     DDE_SUS_KEYWORDS = (
@@ -202,6 +275,23 @@ class Oletools(ServiceBase):
             b".wsh",
         )
     )
+    # Alerts for the (upper case) class names of RTF OLE objects used in exploits
+    RTF_EXPLOIT_CLASS_NAMES: ClassVar[dict[bytes, str]] = {
+        # Supported by https://github.com/viper-framework/viper-modules/blob/00ee6cd2b2ad4ed278279ca9e383e48bc23a2555/rtf.py#L89
+        # Detect OLE2Link exploit
+        # http://www.kb.cert.org/vuls/id/921560
+        # Also possible indicator for https://nvd.nist.gov/vuln/detail/CVE-2023-36884
+        b"OLE2LINK": (
+            "Possibly an exploit for the OLE2Link vulnerability (VU#921560, CVE-2017-0199) or (CVE-2023-36884)"
+        ),
+        # Inspired by https://github.com/viper-framework/viper-modules/blob/00ee6cd2b2ad4ed278279ca9e383e48bc23a2555/rtf.py#L89
+        # Detect Equation Editor exploit
+        # https://www.kb.cert.org/vuls/id/421280/
+        b"EQUATION.3": "Possibly an exploit for the Equation Editor vulnerability (VU#421280, CVE-2017-11882)",
+    }
+
+    # File extensions for extracted RTF OLE objects by (lower case) class name prefix
+    RTF_CLASS_NAME_EXTENSIONS = ((b"word", "doc"), (b"package", "package"))
 
     # Don't reward use of common keywords
     MACRO_SKIP_WORDS = frozenset(
@@ -293,14 +383,19 @@ class Oletools(ServiceBase):
     )
 
     # Bytes Regex's
-    IP_RE = rb"^((?:(?:25[0-5]|2[0-4][0-9]|1[0-9]{2}|[1-9]?[0-9])[.]){3}(?:25[0-5]|2[0-4][0-9]|1[0-9]{2}|[1-9]?[0-9]))"
-    EXTERNAL_LINK_RE = (
+    IP_RE = re.compile(
+        rb"^((?:(?:25[0-5]|2[0-4][0-9]|1[0-9]{2}|[1-9]?[0-9])[.]){3}(?:25[0-5]|2[0-4][0-9]|1[0-9]{2}|[1-9]?[0-9]))"
+    )
+    EXTERNAL_LINK_RE = re.compile(
         rb'(?s)[Tt]ype="[^"]{1,512}/([^"/]+)"[^>]{1,512}[Tt]arget="((?!file)[^"]+)"[^>]{1,512}'
         rb'[Tt]argetMode="External"'
     )
-    JAVASCRIPT_RE = rb'(?s)script.{1,512}("JScript"|javascript)'
-    EXCEL_BIN_RE = rb"(sheet|printerSettings|queryTable|binaryIndex|table)\d{1,12}\.bin"
-    VBS_HEX_RE = rb"(?:&H[A-Fa-f0-9]{2}&H[A-Fa-f0-9]{2}){32,}"
+    JAVASCRIPT_RE = re.compile(rb'(?s)script.{1,512}("JScript"|javascript)')
+    EXCEL_BIN_RE = re.compile(rb"(sheet|printerSettings|queryTable|binaryIndex|table)\d{1,12}\.bin")
+    VBS_HEX_RE = re.compile(rb"(?:&H[A-Fa-f0-9]{2}&H[A-Fa-f0-9]{2}){32,}")
+    # Prefilters: every IOC pattern needs a letter or digit, and base64 needs a run of at least 4 base64 characters
+    ALNUM_RE = re.compile(rb"[A-Za-z0-9]")
+    BASE64_RUN_RE = re.compile(rb"[A-Za-z0-9+/]{4}")
     SUSPICIOUS_STRINGS = (
         # This is based on really old unmaintained stuff and should be replaced
         # In maldoc.yara from decalage2/oledump-contrib/blob/master/
@@ -308,37 +403,51 @@ class Oletools(ServiceBase):
             rb"(CloseHandle|CreateFile|GetProcAddr|GetSystemDirectory|GetTempPath|GetWindowsDirectory|IsBadReadPtr"
             rb"|IsBadWritePtr|LoadLibrary|ReadFile|SetFilePointer|ShellExecute|URLDownloadToFile|VirtualAlloc|WinExec"
             rb"|WriteFile)",
-            b"use of suspicious system function",
+            "use of suspicious system function",
         ),
         # EXE
-        (rb"This program cannot be run in DOS mode", b"embedded executable"),
-        (rb"(?s)MZ.{32,1024}PE\000\000", b"embedded executable"),
+        (rb"This program cannot be run in DOS mode", "embedded executable"),
+        (rb"(?s)MZ.{32,1024}PE\000\000", "embedded executable"),
         # Javascript
         (
             rb"(function\(|\beval[ \t]*\(|new[ \t]+ActiveXObject\(|xfa\.((resolve|create)Node|datasets|form)"
             rb"|\.oneOfChild)",
-            b"embedded javascript",
+            "embedded javascript",
         ),
         # Inspired by https://github.com/CYB3RMX/Qu1cksc0pe/blob/master/Systems/Multiple/malicious_rtf_codes.json
-        (rb"(unescape\(|document\.write)", b"embedded javascript"),
+        (rb"(unescape\(|document\.write)", "embedded javascript"),
         # Malicious RTF codes
         # Inspired by https://github.com/CYB3RMX/Qu1cksc0pe/blob/master/Systems/Multiple/malicious_rtf_codes.json
         (
             rb"(%28%22%45%6E%61%62%6C%65%20%65%64%69%74%69%6E%67%22%29|Enable editing|\\objhtml|\\objdata|\\bin"
             rb"|\\objautlink|No\: 20724414|%4E%6F%3A%20%32%30%37%32%34%34%31%34|passwordhash)",
-            b"suspicious rtf code",
+            "suspicious rtf code",
         ),
     )
 
+    # Compiled once with their descriptions so the per-stream loops don't go through the re cache
+    SUSPICIOUS_STRINGS_RE = tuple((re.compile(pattern, re.MULTILINE), desc) for pattern, desc in SUSPICIOUS_STRINGS)
+
     # String Regex's
-    CVE_RE = r"CVE-[0-9]{4}-[0-9]*"
-    MACRO_WORDS_RE = r"[a-z]{3,}"
-    CHR_ADD_RE = r"chr[$]?\((\d+) \+ (\d+)\)"
-    CHRW_ADD_RE = r"chrw[$]?\((\d+) \+ (\d+)\)"
-    CHR_SUB_RE = r"chr[$]?\((\d+) - (\d+)\)"
-    CHRW_SUB_RE = r"chrw[$]?\((\d+) - (\d+)\)"
-    CHR_RE = r"chr[$]?\((\d+)\)"
-    CHRW_RE = r"chrw[$]?\((\d+)\)"
+    CVE_RE = re.compile(r"CVE-[0-9]{4}-[0-9]*")
+    # Only the first character of a url hostname is checked
+    HOSTNAME_START_RE = re.compile("(?i)[a-z0-9.-]")
+    MACRO_WORDS_RE = re.compile(r"[a-z]{3,}")
+    # chr(x), chrw(x), chr(x + y), chr(x - y), etc. with an optional $ suffix on the function name
+    CHR_CALL_RE = re.compile(r"chr(w?)[$]?\((\d+)(?: ([+-]) (\d+))?\)", re.IGNORECASE)
+    # Filename sanitization, see _sanitize_filename
+    FILENAME_BAD_CHARS_RE = re.compile(r"[^\w.\- ]")
+    FILENAME_DOTS_RE = re.compile(r"\.{2,}")
+    FILENAME_SPACES_RE = re.compile(r" {2,}")
+    # RTF \uN unicode control words and escaped characters
+    RTF_ESCAPED_STR_RE = re.compile(r"\\(?:(?P<uN>u-?[0-9]+[?]?)|(?P<other>.))")
+    # Document passwords set by macros
+    PASSWORD_DOCUMENT_RE = re.compile('PasswordDocument:="([^"]+)"')
+    # External relationships among the children of an OOXML _rels document, filtered by libxml2
+    EXTERNAL_RELATIONSHIP_XPATH = etree.XPath(
+        "r:Relationship[@TargetMode='External' and @Target and @Type]",
+        namespaces={"r": oleobj.OOXML_RELATIONSHIP_TAG[1:].split("}", 1)[0]},
+    )
 
     def __init__(self, config: dict | None = None) -> None:
         """Create an instance of the Oletools service.
@@ -354,8 +463,14 @@ class Oletools(ServiceBase):
         self._extracted_files: dict[str, str] = {}
         self.request: ServiceRequest | None = None
         self.sha = ""
+        # Bounded caches of (size, oleid/msodde/olevba result) by file sha256, for resubmissions of the same sample
+        self._oleid_cache: dict[str, tuple[int, list[oleid.Indicator]]] = {}
+        self._dde_cache: dict[str, tuple[int, str]] = {}
+        # (vba_stomping, pcode, xlm_macros, (code, sha256) of the macros) found by VBA_Parser, see _parse_macros
+        self._macro_cache: dict[str, tuple[int, tuple[bool, list[str], list[str] | None, list[tuple[str, str]]]]] = {}
 
-        self.word_chains: dict[str, set[str]] = {}
+        # English trigraphs, used to score how random macro words look
+        self.trigraphs: frozenset[str] = frozenset()
 
         self.macro_score_max_size: int | None = self.config.get("macro_score_max_file_size", None)
         self.macro_score_min_alert: float = self.config.get("macro_score_min_alert", 0.6)
@@ -364,39 +479,80 @@ class Oletools(ServiceBase):
         self.ioc_exact_safelist: list[str] = [string.lower() for string in self.config.get("ioc_exact_safelist", [])]
         self.pat_safelist = self.URI_SAFELIST
         self.tag_safelist = self.TAG_SAFELIST
+        # pat_safelist as a single pattern, so that tags are searched for all the substrings at once
+        self._pat_safelist_re = self._compile_pat_safelist(self.pat_safelist)
+        # Safelisting of the IOCs found by _check_for_patterns, for the current safelists
+        self._ioc_safelisted: dict[tuple[str, bytes], bool] = {}
 
         self.patterns = PatternMatch()
         self.macros: list[str] = []
+        # sha256 of the macros hashed while extracting them, so they aren't hashed again for tagging
+        self.macro_hashes: dict[str, str] = {}
         self.xlm_macros: list[str] = []
         self.pcode: list[str] = []
         self.extracted_clsids: set[str] = set()
         self.vba_stomping = False
+        # Reused so the magic database is only loaded once
+        self._magic = magic.Magic(mime=True)
+        self._magic_desc = magic.Magic()
         self.identify = get_identify(use_cache=os.environ.get("PRIVILEGED", "false").lower() == "true")
 
+        self.match_safelist: dict[str, list[str]] = {}
+        self.regex_safelist: dict[str, list[str]] = {}
+        # Lookups for is_safelisted, computed from the above by _set_safelist
+        self._safelist_matches: dict[str, set[str]] = {}
+        self._safelist_regexes: dict[str, list[re.Pattern[str]]] = {}
         # Use default safelist for testing and backup
-        safelist = get_tag_safelist_data()
-        self.match_safelist: dict[str, list[str]] = safelist.get("match", {})
-        self.regex_safelist: dict[str, list[str]] = safelist.get("regex", {})
+        self._set_safelist(get_tag_safelist_data())
 
     def start(self) -> None:
         """Initialize the service."""
         chain_path = os.path.join(os.path.dirname(__file__), "chains.json.gz")
-        with gzip.open(chain_path) as f:
-            self.word_chains = {k: set(v) for k, v in json.load(f).items()}
+        # Decompress in one call rather than through the GzipFile reader (wbits for a gzip header)
+        with open(chain_path, "rb") as f:
+            chains = json.loads(zlib.decompress(f.read(), wbits=zlib.MAX_WBITS | 16))
+        # The chains map a first letter to the letter pairs that follow it, flatten them to the trigraphs
+        self.trigraphs = frozenset(prefix + pair for prefix, pairs in chains.items() for pair in pairs)
+
+        # Keep oletools messages from falling back to stderr if nothing configured the root logger
+        root_logger = logging.getLogger()
+        if not root_logger.handlers:
+            root_logger.addHandler(logging.NullHandler())
 
         try:
-            safelist = self.get_api_interface().get_safelist()
-            self.match_safelist = safelist.get("match", {})
-            self.regex_safelist = safelist.get("regex", {})
+            self._set_safelist(self.get_api_interface().get_safelist())
         except ServiceAPIError as e:
             self.log.warning("Couldn't retrieve safelist from service: %s. Continuing without it..", e)
 
+    def _set_safelist(self, safelist: Mapping[str, dict[str, list[str]]]) -> None:
+        """Set the tag safelist and precompute the lookups used by is_safelisted.
+
+        Args:
+            safelist: The safelist data, with the "match" and "regex" safelists by tag type.
+        """
+        self.match_safelist = safelist.get("match", {})
+        self.regex_safelist = safelist.get("regex", {})
+        self._safelist_matches = {
+            tag_type: {match.lower() for match in matches} for tag_type, matches in self.match_safelist.items()
+        }
+        self._safelist_regexes = {
+            tag_type: compile_safelist_regexes(regexes) for tag_type, regexes in self.regex_safelist.items() if regexes
+        }
+
+    @staticmethod
+    def _compile_pat_safelist(pat_safelist: list[str]) -> re.Pattern[str]:
+        """Combine substrings to safelist into a single pattern."""
+        return re.compile("|".join(re.escape(string) for string in pat_safelist))
+
     def is_safelisted(self, tag_type: str, tag: str) -> bool:
-        return (
-            any(string in tag for string in self.pat_safelist)
-            or tag.lower() in self.tag_safelist
-            or is_safelisted(tag_type, tag, self.match_safelist, self.regex_safelist)
-        )
+        tag_lower = tag.lower()
+        if (
+            self._pat_safelist_re.search(tag)
+            or tag_lower in self.tag_safelist
+            or tag_lower in self._safelist_matches.get(tag_type, ())
+        ):
+            return True
+        return any(pattern.match(tag) for pattern in self._safelist_regexes.get(tag_type, ()))
 
     def get_tool_version(self) -> str:
         """Return the version of oletools used by the service."""
@@ -408,9 +564,12 @@ class Oletools(ServiceBase):
         self.request = request
         self._extracted_files = {}
         self.sha = request.sha256
+        # If for some reason the directory doesn't exist, create it once rather than on every extraction
+        os.makedirs(self.working_directory, exist_ok=True)
         self.extracted_clsids = set()
 
         self.macros = []
+        self.macro_hashes = {}
         self.xlm_macros = []
         self.pcode = []
         self.vba_stomping = False
@@ -421,35 +580,41 @@ class Oletools(ServiceBase):
         else:
             self.pat_safelist = self.URI_SAFELIST + self.ioc_pattern_safelist
             self.tag_safelist = self.TAG_SAFELIST + self.ioc_exact_safelist
+        self._pat_safelist_re = self._compile_pat_safelist(self.pat_safelist)
+        self._ioc_safelisted = {}
 
         file_contents = request.file_contents
         path = request.file_path
         result = request.result
         is_installer = request.task.file_type == "document/installer/windows"
+        is_zip = zipfile.is_zipfile(path)
+        zip_file = self._open_zip(path) if is_zip else None
 
         try:
-            if section := self._check_for_indicators(path):
-                result.add_section(section)
             if section := self._check_for_indicators(path):
                 result.add_section(section)
             if section := self._check_for_dde_links(path):
                 result.add_section(section)
             if request.task.file_type == "document/office/mhtml" and (section := self._rip_mhtml(file_contents)):
                 result.add_section(section)
-            self._extract_streams(path, result, request.deep_scan, is_installer)
+            self._extract_streams(path, result, request.deep_scan, is_installer, zip_file)
             if not is_installer and (section := self._extract_rtf(file_contents)):
                 result.add_section(section)
             if section := self._check_for_macros(path, request.sha256):
                 result.add_section(section)
             if section := self._create_macro_sections(request.sha256):
                 result.add_section(section)
-            if zipfile.is_zipfile(path):
+            if is_zip:
                 if section := self._check_zip(path):
                     result.add_section(section)
-                self._check_xml_strings(path, result, request.deep_scan)
+                if zip_file is not None:
+                    self._check_xml_strings(zip_file, result, request.deep_scan)
             self._odf_with_macros(request)
         except Exception:
             self.log.exception("We have encountered a critical error for sample %s", self.sha)
+        finally:
+            if zip_file is not None:
+                zip_file.close()
 
         if request.deep_scan:
             # Proceed with OLE Deep extraction
@@ -476,6 +641,50 @@ class Oletools(ServiceBase):
             )
         request.set_service_context(self.get_tool_version())
 
+    def _open_zip(self, path: str) -> zipfile.ZipFile | None:
+        """Open the sample as a zip file, so that the central directory is only parsed once.
+
+        Args:
+            path: Path to original sample.
+
+        Returns:
+            The opened zip file, or None if it couldn't be opened.
+        """
+        try:
+            return zipfile.ZipFile(path)
+        except Exception:
+            self.log.warning("Failed to open zipped file for sample %s:", self.sha, exc_info=True)
+        return None
+
+    def _result_cache_key(self, path: str) -> str:
+        """Get the key of the file at path in the result caches: its sha256, which is known for the sample itself."""
+        if self.request is not None and path == self.request.file_path:
+            return self.sha
+        with open(path, "rb") as f:
+            return hashlib.sha256(f.read()).hexdigest()
+
+    @staticmethod
+    def _cached_result(cache: dict[str, tuple[int, Any]], key: str) -> Any:
+        """Get the cached result for a file, or None if it isn't cached."""
+        cached = cache.get(key)
+        return None if cached is None else cached[1]
+
+    def _cache_result(self, cache: dict[str, tuple[int, Any]], key: str, value: Any, size: int) -> None:
+        """Store a result for a file, evicting the oldest entries to keep the cache within its limits.
+
+        Args:
+            cache: The cache to store the result in.
+            key: The key of the file (see _result_cache_key).
+            value: The result for the file.
+            size: The approximate size of the result (the length of its text).
+        """
+        if size > self.RESULT_CACHE_BYTES:
+            return
+        total = size + sum(entry_size for entry_size, _ in cache.values())
+        while cache and (len(cache) >= self.RESULT_CACHE_SIZE or total > self.RESULT_CACHE_BYTES):
+            total -= cache.pop(next(iter(cache)))[0]
+        cache[key] = (size, value)
+
     def _check_for_indicators(self, filename: str) -> ResultSection | None:
         """Find and report on indicator objects typically present in malicious files.
 
@@ -487,8 +696,13 @@ class Oletools(ServiceBase):
         """
         # noinspection PyBroadException
         try:
-            ole_id = oleid.OleID(filename)
-            indicators = ole_id.check()
+            key = self._result_cache_key(filename)
+            indicators = self._cached_result(self._oleid_cache, key)
+            if indicators is None:
+                indicators = list(oleid.OleID(filename).check())
+                self._cache_result(
+                    self._oleid_cache, key, indicators, sum(len(str(indicator.value)) for indicator in indicators)
+                )
             section = ResultSection("OleID indicators", heuristic=Heuristic(34))
 
             for indicator in indicators:
@@ -530,11 +744,13 @@ class Oletools(ServiceBase):
         # noinspection PyBroadException
         try:
             # TODO -- undetermined if other fields could be misused.. maybe do 2 passes, 1 filtered & 1 not
-            links_text = msodde.process_file(filepath=filepath, field_filter_mode=msodde.FIELD_FILTER_DDE)
-
-            # TODO -- Workaround: remove root handler(s) that was added with implicit log_helper.enable_logging() call
-            logging.getLogger().handlers = []
-
+            key = self._result_cache_key(filepath)
+            links_text = self._cached_result(self._dde_cache, key)
+            if links_text is None:
+                # Stop msodde from configuring the root logger, only for the duration of the call
+                with patch.object(log_helper, "enable_logging", lambda *args, **kwargs: None):
+                    links_text = msodde.process_file(filepath=filepath, field_filter_mode=msodde.FIELD_FILTER_DDE)
+                self._cache_result(self._dde_cache, key, links_text, len(links_text))
             links_text = links_text.strip()
             if links_text:
                 return self._process_dde_links(links_text)
@@ -609,20 +825,32 @@ class Oletools(ServiceBase):
             A result section with the extracted activemime filenames if any are found.
         """
         mime_res = ResultSection("ActiveMime Document(s) in multipart/related", heuristic=Heuristic(26))
-        mhtml = email.message_from_bytes(data)
         # find all the attached files:
-        for part in mhtml.walk():
-            content_type = part.get_content_type()
-            if content_type == "application/x-mso":
-                part_data = part.get_payload(decode=True)
-                if len(part_data) > 0x32 and part_data[:10].lower() == "activemime":
-                    try:
-                        part_data = zlib.decompress(part_data[0x32:])  # Grab  the zlib-compressed data
-                        part_filename = part.get_filename(failobj="")
-                        self._extract_file(part_data, part_filename, "ActiveMime x-mso from multipart/related.")
-                        mime_res.add_line(part_filename)
-                    except Exception as e:
-                        self.log.debug("Could not decompress ActiveMime part for sample %s", self.sha, exc_info=True)
+        for headers, body in iter_mime_parts(data):
+            content_type = headers.get(b"content-type", b"")
+            if content_type.split(b";", 1)[0].strip().lower() != b"application/x-mso":
+                continue
+            encoding = headers.get(b"content-transfer-encoding", b"").lower()
+            try:
+                if encoding == b"base64":
+                    part_data = binascii.a2b_base64(body)
+                elif encoding == b"quoted-printable":
+                    part_data = binascii.a2b_qp(body)
+                else:
+                    part_data = body
+            except binascii.Error:
+                self.log.debug("Could not decode x-mso part for sample %s", self.sha, exc_info=True)
+                continue
+            if len(part_data) > 0x32 and part_data[:10].lower() == b"activemime":
+                try:
+                    part_data = zlib.decompress(part_data[0x32:])  # Grab  the zlib-compressed data
+                    disposition = headers.get(b"content-disposition", b"")
+                    filename = MIME_FILENAME_RE.search(disposition) or MIME_NAME_RE.search(content_type)
+                    part_filename = safe_str(filename.group(1) or filename.group(2)) if filename else ""
+                    self._extract_file(part_data, part_filename, "ActiveMime x-mso from multipart/related.")
+                    mime_res.add_line(part_filename)
+                except Exception:
+                    self.log.debug("Could not decompress ActiveMime part for sample %s", self.sha, exc_info=True)
 
         return mime_res if mime_res.body else None
 
@@ -630,7 +858,12 @@ class Oletools(ServiceBase):
 
     # noinspection PyBroadException
     def _extract_streams(
-        self, file_name: str, result: Result, extract_all: bool = False, is_installer: bool = False
+        self,
+        file_name: str,
+        result: Result,
+        extract_all: bool = False,
+        is_installer: bool = False,
+        zip_file: zipfile.ZipFile | None = None,
     ) -> None:
         """Extract OLE streams and reports on metadata and suspicious properties.
 
@@ -639,6 +872,7 @@ class Oletools(ServiceBase):
             result: Top level result for adding stream result sections.
             extract_all: Whether to extract all streams.
             is_installer: Whether the file is an installer
+            zip_file: The original sample opened as a zip file, if it is one.
         """
         try:
             # Streams in the submitted ole file
@@ -647,19 +881,18 @@ class Oletools(ServiceBase):
             if ole_res is not None:
                 result.add_section(ole_res)
 
-            if not zipfile.is_zipfile(file_name):
+            if zip_file is None:
                 return  # File is not ODF
 
             # Streams in ole files embedded in submitted ODF file
             subdoc_res = ResultSection("Embedded OLE files")
-            with zipfile.ZipFile(file_name) as z:
-                for f_name in z.namelist():
-                    with z.open(f_name) as f:
-                        subdoc_section = self._process_ole_file(f_name, f, extract_all, is_installer)
-                        if subdoc_section:
-                            subdoc_res.add_subsection(subdoc_section)
-                            f.seek(0)
-                            self._extract_file(f.read(), os.path.splitext(f_name)[1], f"Embedded OLE File {f_name}")
+            for f_name in zip_file.namelist():
+                with zip_file.open(f_name) as f:
+                    subdoc_section = self._process_ole_file(f_name, f, extract_all, is_installer)
+                    if subdoc_section:
+                        subdoc_res.add_subsection(subdoc_section)
+                        f.seek(0)
+                        self._extract_file(f.read(), os.path.splitext(f_name)[1], f"Embedded OLE File {f_name}")
 
             if subdoc_res.subsections:
                 if ole_res is not None:  # OLE subdocuments in theme data zip
@@ -725,21 +958,36 @@ class Oletools(ServiceBase):
         sus_res = False
         sus_sec = ResultSection("Suspicious stream content:", heuristic=Heuristic(9, frequency=0))
 
-        ole_dir_examined = set()
+        # Streams by (length, first bytes, last bytes). The first stream with a key is kept as its entry, once another
+        # stream shares that key it is replaced by the digests of those streams so duplicates are only hashed once.
+        ole_dir_examined: dict[tuple[int, bytes, bytes], list[str] | set[bytes]] = {}
         for entry in ole.listdir():
             extract_stream = False
             stream_name = safe_str("/".join(entry))
             self.log.debug("Extracting stream %s for sample %s", stream_name, self.sha)
             with ole.openstream(entry) as stream:
-                data = stream.getvalue()
-                stm_sha = hashlib.sha256(data).hexdigest()
+                data = stream_data = stream.getvalue()
                 # Only process unique content
-                if stm_sha in ole_dir_examined:
+                key = (len(data), data[:64], data[-64:])
+                examined = ole_dir_examined.get(key)
+                if examined is None:
+                    ole_dir_examined[key] = entry
+                elif len(data) <= 128:
+                    # The key already holds the whole stream
                     continue
-                ole_dir_examined.add(stm_sha)
+                else:
+                    if not isinstance(examined, set):
+                        with ole.openstream(examined) as first:
+                            examined = ole_dir_examined[key] = {hashlib.sha256(first.getvalue()).digest()}
+                    digest = hashlib.sha256(data).digest()
+                    if digest in examined:
+                        continue
+                    examined.add(digest)
                 try:
-                    # Find flash objects in streams
-                    if b"FWS" in data or b"CWS" in data and self._extract_swf_objects(stream):
+                    # Find flash objects in streams, data is already fully in memory (olefile reads whole streams)
+                    # so the substring checks are the cheap prescreen before the stream is scanned for SWF headers.
+                    # An uncompressed SWF header alone is reported without verifying it.
+                    if b"FWS" in data or (b"CWS" in data and self._extract_swf_objects(stream)):
                         swf_sec.add_line(f"Flash object detected in OLE stream {stream_name}")
                 except Exception:
                     self.log.exception(
@@ -758,35 +1006,32 @@ class Oletools(ServiceBase):
                     pwrpnt_res = True
                     continue
 
-                if decompress:
+                # A first block type of 3 is reserved, so the stream can't be raw deflate
+                if decompress and data and (data[0] & 0x06) != 0x06:
                     try:
                         data = zlib.decompress(data, -15)
                     except zlib.error:
                         pass
 
-                # Find hex encoded chunks
-                for vbshex in re.findall(self.VBS_HEX_RE, data):
-                    if self._extract_vb_hex(vbshex):
-                        hex_sec.add_line(f"Found large chunk of VBA hex notation in stream {stream_name}")
+                # Find hex encoded chunks (a match needs at least 64 '&H', skip the regex when there can't be one)
+                if data.count(b"&H") >= 64:
+                    for vbshex in self.VBS_HEX_RE.findall(data):
+                        if self._extract_vb_hex(vbshex):
+                            hex_sec.add_line(f"Found large chunk of VBA hex notation in stream {stream_name}")
 
-                # Find suspicious strings
-                # Look for suspicious strings
-                for pattern, desc in self.SUSPICIOUS_STRINGS:
-                    matched = re.search(pattern, data, re.MULTILINE)
-                    if matched and "_VBA_PROJECT" not in stream_name:
+                # Look for suspicious strings, the results are ignored for the VBA project stream
+                if "_VBA_PROJECT" not in stream_name:
+                    for matched, desc in self._find_suspicious_strings(data):
                         extract_stream = True
                         sus_res = True
-                        body = (
-                            f"'{safe_str(matched.group(0))}' string found in stream "
-                            f"{stream_name}, indicating {safe_str(desc)}"
-                        )
-                        if b"javascript" in desc:
+                        body = f"'{safe_str(matched)}' string found in stream {stream_name}, indicating {desc}"
+                        if "javascript" in desc:
                             sus_sec.add_subsection(
                                 ResultSection(
                                     "Suspicious string found: 'javascript'", body=body, heuristic=Heuristic(23)
                                 )
                             )
-                        elif b"executable" in desc:
+                        elif "executable" in desc:
                             sus_sec.add_subsection(ResultSection("Suspicious string found: 'executable'", body=body))
                             if not is_installer:  # executables are expected inside of installers
                                 sus_sec.set_heuristic(24)
@@ -796,7 +1041,7 @@ class Oletools(ServiceBase):
                             )
 
                 # Finally look for other IOC patterns, will ignore SRP streams for now
-                if not re.match(r"__SRP_[0-9]*", stream_name):
+                if not stream_name.startswith("__SRP_"):
                     iocs, extract_stream = self._check_for_patterns(data, extract_all)
                     if iocs:
                         sus_sec.add_line(f"IOCs in {stream_name}:")
@@ -816,9 +1061,17 @@ class Oletools(ServiceBase):
 
                 # All streams are extracted with deep scan or if it is an installer
                 if extract_stream or swf_sec.body or hex_sec.body or extract_all or is_installer:
+                    stm_sha = None
                     if exstr_sec:
+                        stm_sha = hashlib.sha256(stream_data).hexdigest()
                         exstr_sec.add_line(f"Stream Name:{stream_name}, SHA256: {stm_sha}")
-                    self._extract_file(data, ".ole_stream", f"Embedded OLE Stream {stream_name}")
+                    # The stream hash only names the extracted file if the data wasn't decompressed
+                    self._extract_file(
+                        data,
+                        ".ole_stream",
+                        f"Embedded OLE Stream {stream_name}",
+                        stm_sha if data is stream_data else None,
+                    )
                     if decompress and (stream_name.endswith((".ps", ".eps")) or stream_name.startswith("Scripts/")):
                         decompress_macros.append(data)
 
@@ -903,14 +1156,13 @@ class Oletools(ServiceBase):
             A result section with the extracted Authenticode information if any.
         """
         try:
-            sig = RawCertificateFile(BytesIO(signature))
-            signed_datas = [describe_signed_data(signed_data) for signed_data in sig.signed_datas]
+            signed_datas = list(describe_signature(signature))
             tags, formatted_signature = self._format_signer(signed_datas)
 
             sig_section = (
                 ResultSection(
                     "Authenticode Signature",
-                    body=json.dumps(formatted_signature["body"]),
+                    body=json.dumps(formatted_signature["body"], separators=(",", ":")),
                     body_format=BODY_FORMAT.KEY_VALUE,
                     heuristic=Heuristic(55),
                     tags=tags,
@@ -994,27 +1246,35 @@ class Oletools(ServiceBase):
             0x11: "write_reservation_password",
         }
         _ = ole_file.seek(0)
-        data = ole_file.read()
-        sttb_fassoc_idx = data.find(sttb_fassoc_start_bytes)
-        if sttb_fassoc_idx < 0:
-            return None
-        current_pos = sttb_fassoc_idx + len(sttb_fassoc_start_bytes)
-
-        for i in range(18):
-            try:
-                str_len, *_ = struct.unpack("H", data[current_pos : current_pos + 2])
-            except struct.error:
-                self.log.warning("Could not get STTB metadata length, is the data truncated?")
+        try:
+            # Map files on disk instead of reading a copy of the whole file (zip members can't be mapped)
+            data: bytes | mmap.mmap = mmap.mmap(ole_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (AttributeError, OSError, ValueError):
+            data = ole_file.read()
+        try:
+            sttb_fassoc_idx = data.find(sttb_fassoc_start_bytes)
+            if sttb_fassoc_idx < 0:
                 return None
-            current_pos += 2
-            str_len *= 2
-            if str_len > 0:
-                if i in sttb_fassoc_lut and str_len < 512:
-                    safe_val = safe_str(data[current_pos : current_pos + str_len].decode("utf16", "ignore"))
-                    json_body[sttb_fassoc_lut[i]] = safe_val
-                current_pos += str_len
-            else:
-                continue
+            current_pos = sttb_fassoc_idx + len(sttb_fassoc_start_bytes)
+
+            for i in range(18):
+                try:
+                    (str_len,) = struct.unpack_from("<H", data, current_pos)
+                except struct.error:
+                    self.log.warning("Could not get STTB metadata length, is the data truncated?")
+                    return None
+                current_pos += 2
+                str_len *= 2
+                if str_len > 0:
+                    if i in sttb_fassoc_lut and str_len < 512:
+                        safe_val = safe_str(data[current_pos : current_pos + str_len].decode("utf16", "ignore"))
+                        json_body[sttb_fassoc_lut[i]] = safe_val
+                    current_pos += str_len
+                else:
+                    continue
+        finally:
+            if isinstance(data, mmap.mmap):
+                data.close()
 
         if not json_body:
             return None
@@ -1022,7 +1282,7 @@ class Oletools(ServiceBase):
         heuristic, tags = self._process_link("attachedtemplate", link) if link else (None, {})
         return ResultSection(
             "OLE Alternate Metadata:",
-            body=json.dumps(json_body),
+            body=json.dumps(json_body, separators=(",", ":")),
             body_format=BODY_FORMAT.KEY_VALUE,
             heuristic=heuristic,
             tags=tags,
@@ -1048,12 +1308,12 @@ class Oletools(ServiceBase):
         clsid_sec.add_tag("file.ole.clsid", f"{safe_str(ole_clsid)}")
         clsid_desc = clsid.KNOWN_CLSIDS.get(ole_clsid, "unknown CLSID")
         if "CVE" in clsid_desc:
-            for cve in re.findall(self.CVE_RE, clsid_desc):
+            for cve in self.CVE_RE.findall(clsid_desc):
                 clsid_sec.add_tag("attribution.exploit", cve)
             if "Known" in clsid_desc or "exploit" in clsid_desc:
                 clsid_sec.set_heuristic(52)
         clsid_sec_json_body[ole_clsid] = clsid_desc
-        clsid_sec.set_body(json.dumps(clsid_sec_json_body), BODY_FORMAT.KEY_VALUE)
+        clsid_sec.set_body(json.dumps(clsid_sec_json_body, separators=(",", ":")), BODY_FORMAT.KEY_VALUE)
         return clsid_sec
 
     def _process_ole10native(self, stream_name: str, data: bytes, streams_section: ResultSection) -> bool:
@@ -1088,35 +1348,43 @@ class Oletools(ServiceBase):
         streams_section.heuristic.increment_frequency()
         if find_pe_files(native.data):
             streams_section.heuristic.add_signature_id("embedded_pe_file")
-        # handle embedded native macros
-        if native.filename.endswith(".vbs") or native.temp_path.endswith(".vbs") or native.src_path.endswith(".vbs"):
+        # handle embedded native macros (Windows file names are case-insensitive)
+        if any(path.lower().endswith(".vbs") for path in (native.filename, native.temp_path, native.src_path)):
             self.macros.append(safe_str(native.data))
         else:
             # Look for suspicious strings
-            for pattern, desc in self.SUSPICIOUS_STRINGS:
-                matched = re.search(pattern, native.data)
-                if matched:
-                    suspicious = True
-                    if b"javascript" in desc:
-                        sus_sec.add_subsection(
-                            ResultSection("Suspicious string found: 'javascript'", heuristic=Heuristic(23))
-                        )
-                    if b"executable" in desc:
-                        sus_sec.add_subsection(
-                            ResultSection("Suspicious string found: 'executable'", heuristic=Heuristic(24))
-                        )
-                    else:
-                        sus_sec.add_subsection(ResultSection("Suspicious string found", heuristic=Heuristic(25)))
-                    sus_sec.add_line(
-                        f"'{safe_str(matched.group(0))}' string found in stream "
-                        f"{native.src_path}, indicating {safe_str(desc)}"
+            for matched, desc in self._find_suspicious_strings(native.data):
+                suspicious = True
+                if "javascript" in desc:
+                    sus_sec.add_subsection(
+                        ResultSection("Suspicious string found: 'javascript'", heuristic=Heuristic(23))
+                    )
+                if "executable" in desc:
+                    sus_sec.add_subsection(
+                        ResultSection("Suspicious string found: 'executable'", heuristic=Heuristic(24))
                     )
+                else:
+                    sus_sec.add_subsection(ResultSection("Suspicious string found", heuristic=Heuristic(25)))
+                sus_sec.add_line(f"'{safe_str(matched)}' string found in stream {native.src_path}, indicating {desc}")
 
         if suspicious:
             streams_section.add_subsection(sus_sec)
 
         return True
 
+    def _find_suspicious_strings(self, data: bytes) -> list[tuple[bytes, str]]:
+        """Search data for all of the SUSPICIOUS_STRINGS.
+
+        Args:
+            data: The data to be searched.
+
+        Returns:
+            The first match and the description of each suspicious string found, in SUSPICIOUS_STRINGS order.
+        """
+        return [
+            (match.group(), desc) for pattern, desc in self.SUSPICIOUS_STRINGS_RE if (match := pattern.search(data))
+        ]
+
     def _odf_with_macros(self, request: ServiceRequest) -> None:
         """Detect OpenDocument Format files containing macros.
 
@@ -1172,7 +1440,9 @@ class Oletools(ServiceBase):
                         continue
 
                     ole_hash = hashlib.sha256(obj.raw).hexdigest()
-                    self._extract_file(obj.raw, ".pp_ole", "Embedded Ole Storage within PowerPoint Document Stream")
+                    self._extract_file(
+                        obj.raw, ".pp_ole", "Embedded Ole Storage within PowerPoint Document Stream", ole_hash
+                    )
                     streams_section.add_line(
                         f"\tPowerPoint Embedded OLE Storage:\n\t\tSHA-256: {ole_hash}\n\t\t"
                         f"Length: {len(obj.raw)}\n\t\tCompressed: {obj.compressed}"
@@ -1196,13 +1466,17 @@ class Oletools(ServiceBase):
         swf_found = False
         # Taken from oletools.thirdparty.xxpyswf disneyland module
         # def disneyland(f, filename, options):
-        retfind_swf = xxxswf.findSWF(sample_file)
+        # Find the SWF headers like xxxswf.findSWF, with a substring search per signature instead of a regex
         sample_file.seek(0)
+        data = sample_file.read()
+        retfind_swf = []
+        for signature in (b"CWS", b"FWS"):
+            x = data.find(signature)
+            while x >= 0:
+                retfind_swf.append(x)
+                x = data.find(signature, x + len(signature))
         # for each SWF in file
-        for x in retfind_swf:
-            sample_file.seek(x)
-            sample_file.read(1)
-            sample_file.seek(x)
+        for x in sorted(retfind_swf):
             swf = self._verify_swf(sample_file, x)
             if swf is None:
                 continue
@@ -1259,13 +1533,10 @@ class Oletools(ServiceBase):
         Returns:
             True if hex content converted.
         """
-        decoded = b""
-
         # noinspection PyBroadException
         try:
-            while encodedchunk != b"":
-                decoded += binascii.a2b_hex(encodedchunk[2:4])
-                encodedchunk = encodedchunk[4:]
+            # The chunk is a run of &HXX, so dropping the &H markers leaves plain hex
+            decoded = binascii.a2b_hex(encodedchunk.replace(b"&H", b""))
         except Exception:
             # If it fails, assuming not a real byte sequence
             return False
@@ -1308,8 +1579,9 @@ class Oletools(ServiceBase):
         embedded = []
         linked = []
         unknown = []
+        objects_by_format = {oleobj.OleObject.TYPE_EMBEDDED: embedded, oleobj.OleObject.TYPE_LINKED: linked}
         # RTF objdata
-        for rtf_object in rtfp.objects:
+        for i, rtf_object in enumerate(rtfp.objects):
             try:
                 res_txt = ""
                 res_alert = ""
@@ -1329,28 +1601,14 @@ class Oletools(ServiceBase):
                             res_alert += "CODE/EXECUTABLE FILE"
                         else:
                             # check if the file content is executable:
-                            m = magic.Magic()
-                            ftype = m.from_buffer(rtf_object.olepkgdata)
+                            ftype = self._magic_desc.from_buffer(rtf_object.olepkgdata)
                             if "executable" in ftype:
                                 res_alert += "CODE/EXECUTABLE FILE"
                     else:
                         res_txt += "Not an OLE Package"
-                    # Supported by https://github.com/viper-framework/viper-modules/blob/00ee6cd2b2ad4ed278279ca9e383e48bc23a2555/rtf.py#L89
-                    # Detect OLE2Link exploit
-                    # http://www.kb.cert.org/vuls/id/921560
-                    # Also possible indicator for https://nvd.nist.gov/vuln/detail/CVE-2023-36884
-                    if rtf_object.class_name and rtf_object.class_name.upper() == b"OLE2LINK":
-                        res_alert += (
-                            "Possibly an exploit for the OLE2Link vulnerability "
-                            "(VU#921560, CVE-2017-0199) or (CVE-2023-36884)"
-                        )
-                    # Inspired by https://github.com/viper-framework/viper-modules/blob/00ee6cd2b2ad4ed278279ca9e383e48bc23a2555/rtf.py#L89
-                    # Detect Equation Editor exploit
-                    # https://www.kb.cert.org/vuls/id/421280/
-                    elif rtf_object.class_name and rtf_object.class_name.upper() == b"EQUATION.3":
-                        res_alert += (
-                            "Possibly an exploit for the Equation Editor vulnerability (VU#421280, CVE-2017-11882)"
-                        )
+                    # Detect OLE2Link and Equation Editor exploits
+                    if rtf_object.class_name:
+                        res_alert += self.RTF_EXPLOIT_CLASS_NAMES.get(rtf_object.class_name.upper(), "")
                 else:
                     if rtf_object.start is not None:
                         res_txt = f"{hex(rtf_object.start)} is not a well-formed OLE object"
@@ -1361,15 +1619,9 @@ class Oletools(ServiceBase):
                         if streams_res.heuristic is None:
                             streams_res.set_heuristic(19)
 
-                if rtf_object.format_id == oleobj.OleObject.TYPE_EMBEDDED:
-                    embedded.append((res_txt, res_alert))
-                elif rtf_object.format_id == oleobj.OleObject.TYPE_LINKED:
-                    linked.append((res_txt, res_alert))
-                else:
-                    unknown.append((res_txt, res_alert))
+                objects_by_format.get(rtf_object.format_id, unknown).append((res_txt, res_alert))
 
                 # Write object content to extracted file
-                i = rtfp.objects.index(rtf_object)
                 if rtf_object.is_package:
                     if rtf_object.filename:
                         fname = "_" + self._sanitize_filename(rtf_object.filename)
@@ -1381,12 +1633,9 @@ class Oletools(ServiceBase):
                 elif rtf_object.is_ole and rtf_object.oledata_size is not None:
                     # set a file extension according to the class name:
                     class_name = rtf_object.class_name.lower()
-                    if class_name.startswith(b"word"):
-                        ext = "doc"
-                    elif class_name.startswith(b"package"):
-                        ext = "package"
-                    else:
-                        ext = "bin"
+                    ext = next(
+                        (ext for prefix, ext in self.RTF_CLASS_NAME_EXTENSIONS if class_name.startswith(prefix)), "bin"
+                    )
                     fname = f"_object_{hex(rtf_object.start)}.{ext}"
                     self._extract_file(rtf_object.oledata, fname, f"Embedded in OLE object #{i}:")
 
@@ -1408,7 +1657,7 @@ class Oletools(ServiceBase):
                 emb_sec.add_line(txt)
                 if alert:
                     emb_sec.heuristic.add_signature_id("malicious_embedded_object")
-                    for cve in re.findall(self.CVE_RE, alert):
+                    for cve in self.CVE_RE.findall(alert):
                         emb_sec.add_tag("attribution.exploit", cve)
                     emb_sec.add_line(f"Malicious Properties found: {alert}")
         if linked:
@@ -1422,7 +1671,7 @@ class Oletools(ServiceBase):
             for txt, alert in linked:
                 link_sec.add_line(txt)
                 if alert != "":
-                    for cve in re.findall(self.CVE_RE, alert):
+                    for cve in self.CVE_RE.findall(alert):
                         link_sec.add_tag("attribution.exploit", cve)
                     link_sec.heuristic.add_signature_id("malicious_link_object", 1000)
                     link_sec.add_line(f"Malicious Properties found: {alert}")
@@ -1432,7 +1681,7 @@ class Oletools(ServiceBase):
             for txt, alert in unknown:
                 unk_sec.add_line(txt)
                 if alert != "":
-                    for cve in re.findall(self.CVE_RE, alert):
+                    for cve in self.CVE_RE.findall(alert):
                         unk_sec.add_tag("attribution.exploit", cve)
                     is_suspicious = True
                     unk_sec.add_line(f"Malicious Properties found: {alert}")
@@ -1463,23 +1712,19 @@ class Oletools(ServiceBase):
 
         tplt_data = data[start_idx + len(start_bytes) : end_idx].decode("ascii", "ignore").strip()
 
-        re_rtf_escaped_str = re.compile(r"\\(?:(?P<uN>u-?[0-9]+[?]?)|(?P<other>.))")
-
         def unicode_rtf_replace(matchobj: re.Match[str]) -> str:
             r"""Handle Unicode RTF Control Words, only \uN and escaped characters."""
-            for match_name, match_str in matchobj.groupdict().items():
-                if match_str is None:
-                    continue
-                if match_name == "uN":
-                    match_int = int(match_str.strip("u?"))
-                    if match_int < -1:
-                        match_int = 0x10000 + match_int
-                    return chr(match_int)
-                if match_name == "other":
-                    return match_str
-            return matchobj.string
-
-        link = re_rtf_escaped_str.sub(unicode_rtf_replace, tplt_data).encode("utf8", "ignore").strip()
+            match_str = matchobj.group("uN")
+            if match_str is None:
+                return matchobj.group("other")
+            match_int = int(match_str.strip("u?"))
+            if match_int < -1:
+                match_int = 0x10000 + match_int
+            return chr(match_int)
+
+        if "\\" in tplt_data:
+            tplt_data = self.RTF_ESCAPED_STR_RE.sub(unicode_rtf_replace, tplt_data)
+        link = tplt_data.encode("utf8", "ignore").strip()
         safe_link: str = safe_str(link)
 
         if safe_link:
@@ -1489,8 +1734,8 @@ class Oletools(ServiceBase):
             return rtf_tmplt_res
         return None
 
-    @staticmethod
-    def _sanitize_filename(filename: str, replacement: str = "_", max_length: int = 200) -> str:
+    @classmethod
+    def _sanitize_filename(cls, filename: str, replacement: str = "_", max_length: int = 200) -> str:
         """From rtfoby.py. Compute basename of filename. Replaces all non-whitelisted characters.
 
         Args:
@@ -1502,15 +1747,11 @@ class Oletools(ServiceBase):
            Sanitized basename of the file.
         """
         basepath = os.path.basename(filename).strip()
-        sane_fname = re.sub(r"[^\w.\- ]", replacement, basepath)
+        sane_fname = cls.FILENAME_BAD_CHARS_RE.sub(replacement, basepath)
+        sane_fname = cls.FILENAME_DOTS_RE.sub(".", sane_fname)
+        sane_fname = cls.FILENAME_SPACES_RE.sub(" ", sane_fname)
 
-        while ".." in sane_fname:
-            sane_fname = sane_fname.replace("..", ".")
-
-        while "  " in sane_fname:
-            sane_fname = sane_fname.replace("  ", " ")
-
-        if not len(filename):
+        if not sane_fname:
             sane_fname = "NONAME"
 
         # limit filename length
@@ -1530,6 +1771,50 @@ class Oletools(ServiceBase):
 
         Returns: A result section with the error condition if macros couldn't be analyzed
         """
+        key = self._result_cache_key(filename)
+        cached = self._cached_result(self._macro_cache, key)
+        section = None
+        if cached is None:
+            vba_stomping, pcode_list, xlm_macros, macros, section = self._parse_macros(filename)
+            # Error conditions aren't cached, so they are reported again for the next submission
+            if section is None:
+                self._cache_result(
+                    self._macro_cache,
+                    key,
+                    (vba_stomping, pcode_list, xlm_macros, macros),
+                    sum(map(len, chain(pcode_list, xlm_macros or (), (vba_code for vba_code, _ in macros)))),
+                )
+        else:
+            vba_stomping, pcode_list, xlm_macros, macros = cached
+
+        self.vba_stomping = self.vba_stomping or vba_stomping
+        self.pcode.extend(pcode_list)
+        if xlm_macros is not None:
+            self.xlm_macros = list(xlm_macros)
+        for vba_code, vba_code_sha256 in macros:
+            if vba_code_sha256 == request_hash:
+                continue
+            self.macros.append(vba_code)
+            self.macro_hashes[vba_code] = vba_code_sha256
+        return section
+
+    def _parse_macros(
+        self, filename: str
+    ) -> tuple[bool, list[str], list[str] | None, list[tuple[str, str]], ResultSection | None]:
+        """Extract the VBA content of a file with VBA_Parser, without changing the service state.
+
+        Args:
+            filename: Path to the file.
+
+        Returns:
+            Whether VBA stomping was detected, the p-code, the XLM macros (None if they weren't extracted),
+            the (code, sha256) of the non-empty VBA macros and a section with the error condition if the macros
+            couldn't be analyzed.
+        """
+        vba_stomping = False
+        pcode_list: list[str] = []
+        xlm_macros: list[str] | None = None
+        macros: list[tuple[str, str]] = []
         # noinspection PyBroadException
         try:
             vba_parser = olevba.VBA_Parser(filename)
@@ -1537,19 +1822,19 @@ class Oletools(ServiceBase):
             # Get P-code
             try:
                 if vba_parser.detect_vba_stomping():
-                    self.vba_stomping = True
+                    vba_stomping = True
                 pcode: str = safe_str(vba_parser.extract_pcode())
                 # remove header
                 pcode_l = pcode.split("\n", 2)
                 if len(pcode_l) == 3:
-                    self.pcode.append(pcode_l[2])
+                    pcode_list.append(pcode_l[2])
             except Exception:
                 self.log.debug("pcodedmp.py failed to analyze pcode for sample %s", self.sha)
 
             # Get XLM Macros
             try:
                 if vba_parser.detect_xlm_macros:
-                    self.xlm_macros = vba_parser.xlm_macros
+                    xlm_macros = vba_parser.xlm_macros
             except Exception:
                 pass
             # Get Macros
@@ -1563,28 +1848,25 @@ class Oletools(ServiceBase):
                             assert isinstance(vba_code, str)
                             if vba_code.strip() == "":
                                 continue
-                            vba_code_sha256 = hashlib.sha256(str(vba_code).encode()).hexdigest()
-                            if vba_code_sha256 == request_hash:
-                                continue
-
-                            self.macros.append(vba_code)
+                            macros.append((vba_code, hashlib.sha256(vba_code.encode()).hexdigest()))
                     except Exception:
                         self.log.debug(
                             "OleVBA VBA_Parser.extract_macros failed for sample %s:", self.sha, exc_info=True
                         )
                         section = ResultSection("OleVBA : Error extracting macros")
                         section.add_tag("technique.macro", "Contains VBA Macro(s)")
-                        return section
+                        return vba_stomping, pcode_list, xlm_macros, macros, section
 
             except Exception as e:
                 self.log.debug("OleVBA VBA_Parser.detect_vba_macros failed for sample %s", self.sha, exc_info=True)
-                return ResultSection(f"OleVBA : Error parsing macros: {e}")
+                section = ResultSection(f"OleVBA : Error parsing macros: {e}")
+                return vba_stomping, pcode_list, xlm_macros, macros, section
 
         except Exception:
             self.log.debug(
                 "OleVBA VBA_Parser constructor failed for sample %s, may not be a supported OLE document", self.sha
             )
-        return None
+        return vba_stomping, pcode_list, xlm_macros, macros, None
 
     def _create_macro_sections(self, request_hash: str) -> ResultSection | None:
         """Create result section for the embedded macros of sample.
@@ -1598,15 +1880,16 @@ class Oletools(ServiceBase):
         macro_section.add_tag("technique.macro", "Contains VBA Macro(s)")
         # noinspection PyBroadException
         try:
-            auto_exec: set[str] = set()
+            # dicts as insertion ordered sets, so that section bodies are deterministic
+            auto_exec: dict[str, None] = {}
             suspicious: set[str] = set()
-            network: set[str] = set()
+            network: dict[str, None] = {}
             network_section = ResultSection("Potential host or network IOCs", heuristic=Heuristic(27, frequency=0))
             for vba_code in self.macros:
                 analyzed_code = self._deobfuscator(vba_code)
                 flag = self._flag_macro(analyzed_code)
                 if self._macro_scanner(analyzed_code, auto_exec, suspicious, network, network_section) or flag:
-                    vba_code_sha256 = hashlib.sha256(vba_code.encode()).hexdigest()
+                    vba_code_sha256 = self.macro_hashes.get(vba_code) or hashlib.sha256(vba_code.encode()).hexdigest()
                     macro_section.add_tag("file.ole.macro.sha256", vba_code_sha256)
                     if not macro_section.heuristic and flag:
                         macro_section.add_line("Macro may be packed or obfuscated.")
@@ -1648,7 +1931,8 @@ class Oletools(ServiceBase):
                     xlm_sec.add_line(match)
             if self.vba_stomping or pcode_matches and pcode_sus and not vba_sus:
                 stomp_sec = ResultSection("VBA Stomping", heuristic=Heuristic(4))
-                pcode_results = "\n".join(m for m in pcode_matches if m not in set(vba_matches))
+                vba_match_set = set(vba_matches)
+                pcode_results = "\n".join([m for m in pcode_matches if m not in vba_match_set])
                 if pcode_results:
                     stomp_sec.add_subsection(
                         ResultSection("Suspicious content in pcode dump not found in macro dump:", body=pcode_results)
@@ -1682,78 +1966,31 @@ class Oletools(ServiceBase):
         deobf = text
         # noinspection PyBroadException
         try:
-            # leading & trailing quotes in each local function are to facilitate the final re.sub in deobfuscator()
+            # leading & trailing quotes in the local function are to facilitate the final re.sub in deobfuscator()
 
             # repeated chr(x + y) calls seen in wild, as per SANS ISC diary from May 8, 2015
-            def deobf_chrs_add(m: re.Match[str]) -> str:
-                if m.group(0):
-                    i = int(m.group(1)) + int(m.group(2))
-
-                    if (i >= 0) and (i <= 255):
-                        return f'"{chr(i)}"'
-                return ""
-
-            deobf = re.sub(self.CHR_ADD_RE, deobf_chrs_add, deobf, flags=re.IGNORECASE)
-
-            def deobf_unichrs_add(m: re.Match[str]) -> str:
-                result = ""
-                if m.group(0):
-                    result = m.group(0)
-
-                    i = int(m.group(1)) + int(m.group(2))
-
-                    # unichr range is platform dependent, either [0..0xFFFF] or [0..0x10FFFF]
-                    if (i >= 0) and ((i <= 0xFFFF) or (i <= 0x10FFFF)):
-                        result = f'"{chr(i)}"'
-                return result
-
-            deobf = re.sub(self.CHRW_ADD_RE, deobf_unichrs_add, deobf, flags=re.IGNORECASE)
-
             # suspect we may see chr(x - y) samples as well
-            def deobf_chrs_sub(m: re.Match[str]) -> str:
-                if m.group(0):
-                    i = int(m.group(1)) - int(m.group(2))
-
-                    if (i >= 0) and (i <= 255):
-                        return f'"{chr(i)}"'
-                return ""
-
-            deobf = re.sub(self.CHR_SUB_RE, deobf_chrs_sub, deobf, flags=re.IGNORECASE)
-
-            def deobf_unichrs_sub(m: re.Match[str]) -> str:
-                if m.group(0):
-                    i = int(m.group(1)) - int(m.group(2))
-
-                    # unichr range is platform dependent, either [0..0xFFFF] or [0..0x10FFFF]
-                    if (i >= 0) and ((i <= 0xFFFF) or (i <= 0x10FFFF)):
-                        return f'"{chr(i)}"'
-                return ""
-
-            deobf = re.sub(self.CHRW_SUB_RE, deobf_unichrs_sub, deobf, flags=re.IGNORECASE)
-
             def deobf_chr(m: re.Match[str]) -> str:
-                if m.group(1):
-                    i = int(m.group(1))
-
-                    if (i >= 0) and (i <= 255):
-                        return f'"{chr(i)}"'
-                return ""
-
-            deobf = re.sub(self.CHR_RE, deobf_chr, deobf, flags=re.IGNORECASE)
-
-            def deobf_unichr(m: re.Match[str]) -> str:
-                if m.group(1):
-                    i = int(m.group(1))
+                unicode, x, operator, y = m.groups()
+                if operator == "+":
+                    i = int(x) + int(y)
+                elif operator == "-":
+                    i = int(x) - int(y)
+                else:
+                    i = int(x)
 
-                    # chr range is platform dependent, either [0..0xFFFF] or [0..0x10FFFF]
-                    if (i >= 0) and ((i <= 0xFFFF) or (i <= 0x10FFFF)):
-                        return f'"{chr(i)}"'
-                return ""
+                # unichr range is platform dependent, either [0..0xFFFF] or [0..0x10FFFF]
+                if 0 <= i <= (0x10FFFF if unicode else 255):
+                    return f'"{chr(i)}"'
+                # Out of range chrw(x + y) calls are left as is, all others are dropped
+                return m.group(0) if unicode and operator == "+" else ""
 
-            deobf = re.sub(self.CHRW_RE, deobf_unichr, deobf, flags=re.IGNORECASE)
+            # Most macros have no chr() calls at all, a substring check is much cheaper than the regex scan
+            if "chr" in deobf.lower():
+                deobf = self.CHR_CALL_RE.sub(deobf_chr, deobf)
 
             # handle simple string concatenations
-            deobf = re.sub('" & "', "", deobf)
+            deobf = deobf.replace('" & "', "")
 
         except Exception:
             self.log.debug("Deobfuscator regex failure for sample %s, reverting to original text", self.sha)
@@ -1783,21 +2020,22 @@ class Oletools(ServiceBase):
         word_count = 0
         byte_count = 0
 
-        for macro_word in re.finditer(self.MACRO_WORDS_RE, macro_text):
+        # Identifiers repeat a lot in code, so only score each distinct word once
+        word_scores: dict[str, float] = {}
+        for macro_word in self.MACRO_WORDS_RE.finditer(macro_text):
             word = macro_word.group(0)
             word_count += 1
             byte_count += len(word)
             if word in self.MACRO_SKIP_WORDS:
                 continue
-            prefix = word[0]
-            tri_count = 0
-            for i in range(1, len(word) - 1):
-                trigraph = word[i : i + 2]
-                if trigraph in self.word_chains.get(prefix, []):
-                    tri_count += 1
-                prefix = word[i]
-
-            score += tri_count / (len(word) - 2)
+            word_score = word_scores.get(word)
+            if word_score is None:
+                tri_count = 0
+                for i in range(len(word) - 2):
+                    if word[i : i + 3] in self.trigraphs:
+                        tri_count += 1
+                word_score = word_scores[word] = tri_count / (len(word) - 2)
+            score += word_score
 
         if byte_count < 128 or word_count < 32:
             # these numbers are arbitrary, but if the sample is too short the score is worthless
@@ -1809,18 +2047,18 @@ class Oletools(ServiceBase):
     def _macro_scanner(
         self,
         text: str,
-        autoexecution: set[str],
+        autoexecution: dict[str, None],
         suspicious: set[str],
-        network: set[str],
+        network: dict[str, None],
         network_section: ResultSection,
     ) -> bool:
         """Scan the text of a macro with VBA_Scanner and collect results.
 
         Args:
             text: Original VBA code.
-            autoexecution: Set for adding autoexecution strings
+            autoexecution: Ordered set (dict keys) for adding autoexecution strings
             suspicious: Set for adding suspicious strings
-            network: Set for adding host/network strings
+            network: Ordered set (dict keys) for adding host/network strings
             network_section: Section for tagging network results
 
         Returns:
@@ -1830,14 +2068,16 @@ class Oletools(ServiceBase):
             vba_scanner = olevba.VBA_Scanner(text)
             vba_scanner.scan(include_decoded_strings=True)
 
-            for string in self.ADDITIONAL_SUSPICIOUS_KEYWORDS:
-                if re.search(string, text, re.IGNORECASE):
+            # The keywords are all literals, a case-insensitive substring check is enough
+            lowered_text = text.lower()
+            for string in self.ADDITIONAL_SUSPICIOUS_KEYWORDS_LOWER:
+                if string in lowered_text:
                     # play nice with detect_suspicious from olevba.py
-                    suspicious.add(string.lower())
+                    suspicious.add(string)
 
             if vba_scanner.autoexec_keywords is not None:
                 for keyword, _ in vba_scanner.autoexec_keywords:
-                    autoexecution.add(keyword.lower())
+                    autoexecution[keyword.lower()] = None
 
             if vba_scanner.suspicious_keywords is not None:
                 for keyword, _ in vba_scanner.suspicious_keywords:
@@ -1853,10 +2093,10 @@ class Oletools(ServiceBase):
                     if isinstance(description, str):
                         description = description.encode("utf-8", errors="ignore")
 
-                    desc_ip = re.match(self.IP_RE, description)
+                    desc_ip = self.IP_RE.match(description)
                     uri, tag_type, tag = self.parse_uri(description)
                     if uri:
-                        network.add(f"{keyword}: {uri}")
+                        network[f"{keyword}: {uri}"] = None
                         if not self.is_safelisted("network.static.uri", uri) and not self.is_safelisted(tag_type, tag):
                             network_section.heuristic.increment_frequency()
                         network_section.add_tag("network.static.uri", uri)
@@ -1869,7 +2109,7 @@ class Oletools(ServiceBase):
                                 network_section.heuristic.increment_frequency()
                             network_section.add_tag("network.static.ip", ip_str)
                     else:
-                        network.add(f"{keyword}: {safe_str(description)}")
+                        network[f"{keyword}: {safe_str(description)}"] = None
 
             return bool(
                 vba_scanner.autoexec_keywords
@@ -1890,25 +2130,27 @@ class Oletools(ServiceBase):
             data = combined.encode()
             combined_sha256 = hashlib.sha256(data).hexdigest()
             if combined_sha256 != request_hash:
-                self._extract_file(data, f"_{filename}.data", description)
+                self._extract_file(data, f"_{filename}.data", description, combined_sha256)
 
         assert self.request
-        passwords = re.findall('PasswordDocument:="([^"]+)"', combined)
+        passwords = self.PASSWORD_DOCUMENT_RE.findall(combined) if "PasswordDocument" in combined else []
         if "passwords" in self.request.temp_submission_data:
             self.request.temp_submission_data["passwords"].extend(passwords)
         else:
             self.request.temp_submission_data["passwords"] = passwords
+        if not combined:
+            return False, []
         rawr_combined = mraptor.MacroRaptor(combined)
         rawr_combined.scan()
         return rawr_combined.suspicious, rawr_combined.matches
 
     # -- XML --
 
-    def _check_xml_strings(self, path: str, result: Result, include_fpos: bool = False) -> None:
+    def _check_xml_strings(self, z: zipfile.ZipFile, result: Result, include_fpos: bool = False) -> None:
         """Search xml content for external targets, indicators, and base64 content.
 
         Args:
-            path: Path to original sample.
+            z: The original sample opened as a zip file.
             result: Result sections are added to this result.
             include_fpos: Whether to include possible false positives in results.
         """
@@ -1920,56 +2162,70 @@ class Oletools(ServiceBase):
         ioc_files: Mapping[str, list[str]] = defaultdict(list)
         # noinspection PyBroadException
         try:
-            xml_extracted = set()
-            with zipfile.ZipFile(path) as z:
-                if section := self._process_ooxml_properties(z):
-                    result.add_section(section)
-                for f in z.namelist():
+            xml_extracted: set[bytes] = set()
+            # Property members already decompressed for the properties section, so they aren't read twice
+            read_members: dict[str, bytes] = {}
+            if section := self._process_ooxml_properties(z, read_members):
+                result.add_section(section)
+            for f in z.namelist():
+                if f in read_members:
+                    contents = read_members.pop(f)
+                else:
                     try:
-                        contents = z.open(f).read()
+                        contents = z.read(f)
                     except zipfile.BadZipFile:
                         continue
 
+                data = None
+                # Members without any markup (media, binaries) can't be XML, don't bother with the parser
+                if b"<" in contents:
                     try:
                         # Deobfuscate xml using parser
                         parsed = etree.XML(contents, None)
                         has_external = self._find_external_links(parsed)
                         data = etree.tostring(parsed)
                     except Exception:
-                        # Use raw if parsing fails
-                        data = contents
-                        has_external = re.findall(self.EXTERNAL_LINK_RE, data)
-
-                    if len(data) > self.MAX_XML_SCAN_CHARS:
-                        data = data[: self.MAX_XML_SCAN_CHARS]
-                        xml_big_res.add_line(f"{f}")
-                        assert xml_big_res.heuristic
-                        xml_big_res.heuristic.increment_frequency()
-
-                    external_links.update(has_external)
-                    has_dde = re.search(rb"ddeLink", data)  # Extract all files with dde links
-                    has_script = re.search(self.JAVASCRIPT_RE, data)  # Extract all files with javascript
-                    extract_regex = bool(has_external or has_dde or has_script)
-
-                    # Check for IOC and b64 data in XML
-                    iocs, extract_ioc = self._check_for_patterns(data, include_fpos)
-                    if iocs:
-                        for tag_type, tags in iocs.items():
-                            for tag in sorted(tags):
-                                ioc_files[tag_type + safe_str(tag)].append(f)
-                                xml_ioc_res.add_tag(tag_type, tag)
-
-                    f_b64res = self._check_for_b64(data, f)
-                    if f_b64res:
-                        f_b64res.set_heuristic(8)
-                        xml_b64_res.add_subsection(f_b64res)
-
-                    # all vba extracted anyways
-                    if (extract_ioc or f_b64res or extract_regex or include_fpos) and not f.endswith("vbaProject.bin"):
-                        xml_sha256 = hashlib.sha256(contents).hexdigest()
-                        if xml_sha256 not in xml_extracted:
-                            self._extract_file(contents, ".xml", f"zipped file {f} contents")
-                            xml_extracted.add(xml_sha256)
+                        pass
+                    # Only the serialized document is scanned, don't keep the tree alive meanwhile
+                    parsed = None
+                if data is None:
+                    # Use raw if parsing fails
+                    data = contents
+                    # Cheap literal prescreen; the regex can only match if its anchor is present
+                    has_external = self.EXTERNAL_LINK_RE.findall(data) if b'argetMode="External"' in data else []
+
+                if len(data) > self.MAX_XML_SCAN_CHARS:
+                    data = data[: self.MAX_XML_SCAN_CHARS]
+                    xml_big_res.add_line(f"{f}")
+                    assert xml_big_res.heuristic
+                    xml_big_res.heuristic.increment_frequency()
+
+                external_links.update(has_external)
+                has_dde = b"ddeLink" in data  # Extract all files with dde links
+                # Extract all files with javascript
+                has_script = (b"JScript" in data or b"javascript" in data) and self.JAVASCRIPT_RE.search(data)
+                extract_regex = bool(has_external or has_dde or has_script)
+
+                # Check for IOC and b64 data in XML
+                iocs, extract_ioc = self._check_for_patterns(data, include_fpos)
+                if iocs:
+                    for tag_type, tags in iocs.items():
+                        for tag in sorted(tags):
+                            ioc_files[tag_type + safe_str(tag)].append(f)
+                            xml_ioc_res.add_tag(tag_type, tag)
+
+                f_b64res = self._check_for_b64(data, f)
+                if f_b64res:
+                    f_b64res.set_heuristic(8)
+                    xml_b64_res.add_subsection(f_b64res)
+
+                # all vba extracted anyways
+                if (extract_ioc or f_b64res or extract_regex or include_fpos) and not f.endswith("vbaProject.bin"):
+                    # Dedup key only, no need for a cryptographic digest
+                    xml_key = hashlib.blake2b(contents, digest_size=16).digest()
+                    if xml_key not in xml_extracted:
+                        self._extract_file(contents, ".xml", f"zipped file {f} contents")
+                        xml_extracted.add(xml_key)
         except Exception:
             self.log.warning("Failed to analyze zipped file for sample %s:", self.sha, exc_info=True)
 
@@ -2016,12 +2272,16 @@ class Oletools(ServiceBase):
         if xml_b64_res.subsections:
             result.add_section(xml_b64_res)
 
-    def _process_ooxml_properties(self, z: zipfile.ZipFile) -> ResultSection | None:
+    def _process_ooxml_properties(
+        self, z: zipfile.ZipFile, read_members: dict[str, bytes] | None = None
+    ) -> ResultSection | None:
         property_section = ResultKeyValueSection("OOXML Properties")
         property_paths = ["docProps/core.xml", "docProps/app.xml"]
         for prop_path in property_paths:
             if prop_path in z.NameToInfo:
-                prop_file = z.open(prop_path).read()
+                prop_file = z.read(prop_path)
+                if read_members is not None:
+                    read_members[prop_path] = prop_file
                 prop_xml = etree.XML(prop_file)
                 for child in prop_xml:
                     label = child.tag.rsplit("}", 1)[-1]
@@ -2047,15 +2307,11 @@ class Oletools(ServiceBase):
                         property_section.add_tag(self.METADATA_TO_TAG[label], child.text)
         return property_section if property_section.body else None
 
-    @staticmethod
-    def _find_external_links(parsed: etree._Element) -> list[tuple[str, str]]:
+    @classmethod
+    def _find_external_links(cls, parsed: etree._Element) -> list[tuple[str, str]]:
         return [
-            (relationship.attrib["Type"].rsplit("/", 1)[1], relationship.attrib["Target"])
-            for relationship in parsed.findall(oleobj.OOXML_RELATIONSHIP_TAG, None)
-            if "Target" in relationship.attrib
-            and "Type" in relationship.attrib
-            and "TargetMode" in relationship.attrib
-            and relationship.attrib["TargetMode"] == "External"
+            (relationship.get("Type").rsplit("/", 1)[1], relationship.get("Target"))
+            for relationship in cls.EXTERNAL_RELATIONSHIP_XPATH(parsed)
         ]
 
     def _check_zip(self, file_path: str) -> ResultSection | None:
@@ -2115,7 +2371,9 @@ class Oletools(ServiceBase):
 
     # -- Helper methods --
 
-    def _extract_file(self, data: bytes, file_name: str, description: str) -> str | None:
+    def _extract_file(
+        self, data: bytes | bytearray, file_name: str, description: str, sha256: str | None = None
+    ) -> str | None:
         """Add data as an extracted file.
 
         Checks that there the service hasn't hit the extraction limit before extracting.
@@ -2124,13 +2382,15 @@ class Oletools(ServiceBase):
             data: The data to extract.
             file_name: File name suffix (all file names start with a part of the hash of the data).
             description: A description of the data.
+            sha256: The sha256 hexdigest of data, if the caller already has it.
         """
         try:
-            # If for some reason the directory doesn't exist, create it
-            if not os.path.exists(self.working_directory):
-                os.makedirs(self.working_directory)
-            file_name = hashlib.sha256(data).hexdigest()[:8] + file_name
+            file_name = (sha256 or hashlib.sha256(data).hexdigest())[:8] + file_name
             file_path = os.path.join(self.working_directory, file_name)
+            if file_name in self._extracted_files:
+                # Already written and identified, only the description changes
+                self._extracted_files[file_name] = description
+                return file_path
             with open(file_path, "wb") as f:
                 f.write(data)
             if self.identify.fileinfo(file_path, generate_hashes=False)["type"] == "unknown":
@@ -2154,15 +2414,22 @@ class Oletools(ServiceBase):
         """
         extract = False
         found_tags = defaultdict(set)
+        if not self.ALNUM_RE.search(data):
+            return {}, extract
 
         # Plain IOCs
         patterns_found = self.patterns.ioc_match(data, bogon_ip=True)
         for tag_type, iocs in patterns_found.items():
             for ioc in iocs:
-                if ioc.endswith(self.PAT_ENDS) or self.is_safelisted(tag_type, safe_str(ioc)):
+                # The same IOCs tend to show up in every stream and xml file of a document
+                safelisted = self._ioc_safelisted.get((tag_type, ioc))
+                if safelisted is None:
+                    safelisted = ioc.endswith(self.PAT_ENDS) or self.is_safelisted(tag_type, safe_str(ioc))
+                    self._ioc_safelisted[(tag_type, ioc)] = safelisted
+                if safelisted:
                     continue
                 # Skip .bin files that are common in normal excel files
-                if not include_fpos and tag_type == "file.name.extracted" and re.match(self.EXCEL_BIN_RE, ioc):
+                if not include_fpos and tag_type == "file.name.extracted" and self.EXCEL_BIN_RE.match(ioc):
                     continue
                 extract = extract or self._decide_extract(tag_type, ioc, include_fpos)
                 found_tags[tag_type].add(ioc)
@@ -2209,42 +2476,53 @@ class Oletools(ServiceBase):
         Returns:
             ResultSection with base64 results if results were found.
         """
+        if not self.BASE64_RUN_RE.search(data):
+            return None
         b64_res = ResultSection(f"Base64 in {dataname}:")
-        b64_ascii_content = []
+        # Newline separated printable content of the decoded candidates
+        b64_ascii_content = bytearray()
 
-        seen_base64 = set()
+        # Fingerprints of the decoded candidates, so that large blobs aren't all kept alive for deduplication
+        seen_base64: set[bytes] = set()
         for base64data, start, end in find_base64(data):
-            if base64data in seen_base64 or not self.MAX_BASE64_CHARS > len(base64data) > 30:
+            if not self.MAX_BASE64_CHARS > len(base64data) > 30:
+                continue
+            b64_key = hashlib.blake2b(base64data, digest_size=16).digest()
+            if b64_key in seen_base64:
                 continue
-            seen_base64.add(base64data)
+            seen_base64.add(b64_key)
 
-            sha256hash = hashlib.sha256(base64data).hexdigest()
             dump_section: ResultSection | None = None
             if len(base64data) > self.MAX_STRINGDUMP_CHARS:
                 # Check for embedded files of interest
-                m = magic.Magic(mime=True)
-                ftype = m.from_buffer(base64data)
+                ftype = self._magic.from_buffer(base64data)
                 if "octet-stream" not in ftype:
                     continue
-                self._extract_file(base64data, "_b64_decoded", "Extracted b64 file during OLETools analysis")
+                sha256hash = hashlib.sha256(base64data).hexdigest()
+                self._extract_file(
+                    base64data, "_b64_decoded", "Extracted b64 file during OLETools analysis", sha256hash
+                )
             else:
                 # Display ascii content
-                check_utf16 = base64data.decode("utf-16", "ignore").encode("ascii", "ignore")
-                if check_utf16 != b"":
-                    asc_b64 = check_utf16
                 # Filter printable characters then put in results
-                asc_b64 = bytes(i for i in base64data if 31 < i < 127)
+                asc_b64 = base64data.translate(None, self.NON_PRINTABLE_BYTES)
                 # If data has less then 7 uniq chars then ignore
-                if len(set(asc_b64)) <= 6 or len(re.sub(rb"\s", b"", asc_b64)) <= 14:
+                # Only printable characters are left, so space is the only whitespace to discount
+                if len(set(asc_b64)) <= 6 or len(asc_b64) - asc_b64.count(b" ") <= 14:
                     continue
                 dump_section = ResultSection(
                     "DECODED ASCII DUMP:", body=safe_str(asc_b64), body_format=BODY_FORMAT.MEMORY_DUMP
                 )
-                b64_ascii_content.append(asc_b64)
+                if b64_ascii_content:
+                    b64_ascii_content += b"\n"
+                b64_ascii_content += asc_b64
+                # Only hash data that is reported
+                sha256hash = hashlib.sha256(base64data).hexdigest()
 
             sub_b64_res = ResultSection(f"Result {sha256hash}", parent=b64_res)
             sub_b64_res.add_line(f"BASE64 TEXT SIZE: {end-start}")
-            sub_b64_res.add_line(f"BASE64 SAMPLE TEXT: {data[start:min(start+50, end)].decode()}[........]")
+            sample_text = data[start : min(start + 50, end)].decode("ascii", "replace")
+            sub_b64_res.add_line(f"BASE64 SAMPLE TEXT: {sample_text}[........]")
             sub_b64_res.add_line(f"DECODED SHA256: {sha256hash}")
             if dump_section:
                 sub_b64_res.add_subsection(dump_section)
@@ -2259,8 +2537,7 @@ class Oletools(ServiceBase):
                     sub_b64_res.add_tag(ty, v)
 
         if b64_ascii_content:
-            all_b64 = b"\n".join(b64_ascii_content)
-            self._extract_file(all_b64, "_b64.txt", f"b64 for {dataname}")
+            self._extract_file(b64_ascii_content, "_b64.txt", f"b64 for {dataname}")
 
         return b64_res if b64_res.subsections else None
 
@@ -2297,17 +2574,18 @@ class Oletools(ServiceBase):
             if str(e) == "Invalid IPv6 URL":
                 return "", "", ""
             raise
-        if not url.scheme or not url.hostname or not re.match("(?i)[a-z0-9.-]+", url.hostname):
+        if not url.scheme or not url.hostname or not self.HOSTNAME_START_RE.match(url.hostname):
             return "", "", ""
 
         url_text = url.scheme + "://" + url.netloc + url.path.split(":", 1)[0] if ":" in url.path else url.geturl()
         if is_valid_domain(url.hostname):
             return url_text, "network.static.domain", url.hostname
         try:
-            parsed_ip = IPv4Address(socket.inet_aton(url.hostname)).compressed
+            # inet_aton also accepts the shorthand and integer forms of IPv4 addresses
+            parsed_ip = socket.inet_ntoa(socket.inet_aton(url.hostname))
             if is_valid_ip(parsed_ip) and not is_ip_reserved(parsed_ip):
                 return url_text, "network.static.ip", parsed_ip
-        except (OSError, AddressValueError, UnicodeDecodeError):
+        except OSError:
             pass
 
         return url_text, "", ""
@@ -2383,7 +2661,7 @@ class Oletools(ServiceBase):
             heuristic.add_attack_id("T1221")
         if hostname_type == "network.static.ip" and link_type != "hyperlink":
             heuristic.add_signature_id("external_link_ip")
-        filename = os.path.basename(urlsplit(url).path)
+        filename = urlsplit(url).path.rpartition("/")[2]
         path_extension = os.path.splitext(filename)[1].encode().lower()
         if (
             path_extension != b".com"
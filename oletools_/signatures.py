@@ -5,9 +5,11 @@ Functions for formatting OLE signature data as JSON
 
 from __future__ import annotations
 
+import functools
+from io import BytesIO
 from typing import TYPE_CHECKING, Any
 
-from signify.authenticode import AuthenticodeSignedData, AuthenticodeSignerInfo, RFC3161SignedData
+from signify.authenticode import AuthenticodeSignedData, AuthenticodeSignerInfo, RawCertificateFile, RFC3161SignedData
 from signify.pkcs7 import SignedData, SignerInfo
 
 if TYPE_CHECKING:
@@ -129,3 +131,14 @@ def describe_signed_data(signed_data: SignedData) -> dict[str, Any]:
             result["verify_error"] = str(e)
 
     return result
+
+
+@functools.lru_cache(maxsize=32)
+def describe_signature(signature: bytes) -> tuple[dict[str, Any], ...]:
+    """Represent each SignedData of a raw Authenticode signature as a JSON object.
+
+    Cached by signature, since the same signature is commonly seen again (resubmissions, embedded documents).
+    The returned objects are shared between calls and must not be modified.
+    """
+    sig = RawCertificateFile(BytesIO(signature))
+    return tuple(describe_signed_data(signed_data) for signed_data in sig.signed_datas)
@@ -230,33 +230,46 @@ class PowerPointDoc(object):
 
         cur_iter = 0
         while cur_iter < self.size:
-            pp_obj = PowerPointObject(buf[cur_iter:])
+            pp_obj = PowerPointObject(buf, cur_iter)
             self.objects.append(pp_obj)
             cur_iter += pp_obj.length
 
 
+# Record header: recVer/recInstance (packed), recType, recLen
+RECORD_HEADER = struct.Struct("<HHI")
+
+
 # Represents an object stream within the PowerPoint Document Stream
 # Will decompress ExOleObjStg objects
 class PowerPointObject(object):
     # noinspection PyBroadException
-    def __init__(self, buf):
-        self.rec_ver = buf[0] & 0xF
-        self.rec_instance = struct.unpack("<H", buf[:2])[0] >> 4
-        self.rec_type = PowerPointDoc.OBJ_TYPES[struct.unpack("<H", buf[2:4])[0]]
-        self.rec_length = struct.unpack("<I", buf[4:8])[0]
+    def __init__(self, buf, offset=0):
+        ver_instance, rec_type, self.rec_length = RECORD_HEADER.unpack_from(buf, offset)
+        self.rec_ver = ver_instance & 0xF
+        self.rec_instance = ver_instance >> 4
+        self.rec_type = PowerPointDoc.OBJ_TYPES[rec_type]
         self.length = self.rec_length + 8
-        self.raw = buf[0x8:0x8 + self.rec_length]
+        # Record data is only copied out of the stream when it is used
+        self._buf = buf
+        self._offset = offset
+        self._raw = None
         self.error = None
 
         if self.rec_type == "ExOleObjStg":
             if self.rec_instance == 0x001:
                 self.compressed = True
                 compressed_size = self.rec_length - 4
-                compressed_buffer = buf[12:12 + compressed_size]
+                compressed_buffer = buf[offset + 12:offset + 12 + compressed_size]
                 try:
                     z = zlib.decompressobj()
-                    self.raw = z.decompress(compressed_buffer)
+                    self._raw = z.decompress(compressed_buffer)
                 except Exception as ex:
                     self.error = "Error decompressing the stream: {}\n".format(ex)
             else:
                 self.compressed = False
+
+    @property
+    def raw(self):
+        if self._raw is None:
+            self._raw = self._buf[self._offset + 0x8:self._offset + 0x8 + self.rec_length]
+        return self._raw
@@ -4,7 +4,7 @@ import pytest
 from assemblyline_v4_service.common.result import Heuristic
 
 from oletools import mraptor, msodde, oleid, oleobj, olevba, rtfobj
-from oletools_.oletools_ import Oletools, Tags
+from oletools_.oletools_ import Oletools, Tags, compile_safelist_regexes, iter_mime_parts
 
 
 def test_get_oletools_version():
@@ -41,6 +41,131 @@ def test_flag_macro():
     ), "Random text not flagged"
 
 
+def test_deobfuscator():
+    ole = Oletools()
+    assert ole._deobfuscator("chr(72) & Chr$(100 + 5) & CHRW(8364) & chr(300) & chrw(68 - 1)") == '"Hi€" &  & "C"'
+    # Out of range chrw(x + y) calls are kept
+    assert ole._deobfuscator("ChrW(1114111 + 1)") == "ChrW(1114111 + 1)"
+
+
+@pytest.mark.parametrize(
+    "filename, output",
+    [
+        ("C:\\Users\\a  b....exe", "C__Users_a b.exe"),
+        ("/tmp/evil<name>.doc", "evil_name_.doc"),
+        ("/tmp/dir/", "NONAME"),
+    ],
+)
+def test_sanitize_filename(filename, output):
+    assert Oletools._sanitize_filename(filename) == output
+
+
+def test_compile_safelist_regexes():
+    patterns = compile_safelist_regexes([r"a.*\.com", r"(b)\1", r"(c)\1x", "[", r"d"])
+    # The regexes without groups are combined, the others are kept on their own and the invalid one is skipped
+    assert len(patterns) == 3
+
+    def matches(tag: str) -> bool:
+        return any(pattern.match(tag) for pattern in patterns)
+
+    assert matches("A.EXAMPLE.COM")
+    assert matches("d")
+    # Combining would renumber the groups and break the backreferences
+    assert matches("bb")
+    assert matches("ccx")
+    assert not matches("bc")
+    assert not matches("ccb")
+    assert not matches("[")
+
+
+def test_iter_mime_parts():
+    mhtml = (
+        b"MIME-Version: 1.0\r\n"
+        b'Content-Type: multipart/related;\r\n\tboundary="----=_NextPart_01"\r\n'
+        b"\r\n"
+        b"This is a multi-part message in MIME format.\r\n"
+        b"------=_NextPart_01\r\n"
+        b"Content-Transfer-Encoding: base64\r\n"
+        b"Content-Type: application/x-mso\r\n"
+        b"\r\n"
+        b"QWN0aXZlTWltZQ==\r\n"
+        b"------=_NextPart_01\r\n"
+        b'Content-Disposition: attachment; filename="page.htm"\r\n'
+        b"\r\n"
+        b"<html></html>\r\n"
+        b"------=_NextPart_01--\r\n"
+    )
+    assert list(iter_mime_parts(mhtml)) == [
+        (
+            {b"content-transfer-encoding": b"base64", b"content-type": b"application/x-mso"},
+            b"QWN0aXZlTWltZQ==\r\n",
+        ),
+        ({b"content-disposition": b'attachment; filename="page.htm"'}, b"<html></html>\r\n"),
+    ]
+    # A boundary that isn't alone on its line isn't a delimiter
+    mhtml = (
+        b'Content-Type: multipart/related; boundary="B"\r\n'
+        b"\r\n"
+        b"--B\r\n"
+        b"Content-Type: text/html\r\n"
+        b"\r\n"
+        b"<html><!-- --B-- --></html>\r\n"
+        b"--B\r\n"
+        b"Content-Type: application/x-mso\r\n"
+        b"\r\n"
+        b"QWN0aXZlTWltZQ==\r\n"
+        b"--B--\r\n"
+    )
+    assert [headers[b"content-type"] for headers, _ in iter_mime_parts(mhtml)] == [
+        b"text/html",
+        b"application/x-mso",
+    ]
+    # Nested multipart with a boundary that starts with the outer boundary
+    mhtml = (
+        b'Content-Type: multipart/related; boundary="B"\r\n'
+        b"\r\n"
+        b"--B\r\n"
+        b'Content-Type: multipart/related; boundary="B--1"\r\n'
+        b"\r\n"
+        b"--B--1\r\n"
+        b"Content-Type: application/x-mso\r\n"
+        b"\r\n"
+        b"QWN0aXZlTWltZQ==\r\n"
+        b"--B--1--\r\n"
+        b"--B--\r\n"
+    )
+    assert list(iter_mime_parts(mhtml)) == [({b"content-type": b"application/x-mso"}, b"QWN0aXZlTWltZQ==\r\n")]
+    # Parameters whose name ends in boundary aren't the boundary
+    mhtml = (
+        b'Content-Type: multipart/related; xboundary="no"; boundary="XX"\r\n'
+        b"\r\n"
+        b"--XX\r\n"
+        b"Content-Type: application/x-mso\r\n"
+        b"\r\n"
+        b"QWN0aXZlTWltZQ==\r\n"
+        b"--XX--\r\n"
+    )
+    assert list(iter_mime_parts(mhtml)) == [({b"content-type": b"application/x-mso"}, b"QWN0aXZlTWltZQ==\r\n")]
+    # Deeply nested multiparts stop being split instead of exhausting the recursion limit
+    mhtml = b"".join(b'Content-Type: multipart/related; boundary="B%d"\r\n\r\n--B%d\r\n' % (i, i) for i in range(2000))
+    parts = list(iter_mime_parts(mhtml))
+    assert len(parts) == 1
+    assert parts[0][0] == {b"content-type": b'multipart/related; boundary="B32"'}
+
+
+def test_find_suspicious_strings():
+    ole = Oletools()
+    assert ole._find_suspicious_strings(b"") == []
+    # The DOS stub is inside the MZ header match, both should be reported
+    pe_header = b"MZ" + b"\x00" * 32 + b"This program cannot be run in DOS mode" + b"PE\x00\x00"
+    assert ole._find_suspicious_strings(b"document.write LoadLibrary " + pe_header + b" LoadLibrary") == [
+        (b"LoadLibrary", "use of suspicious system function"),
+        (b"This program cannot be run in DOS mode", "embedded executable"),
+        (pe_header, "embedded executable"),
+        (b"document.write", "embedded javascript"),
+    ]
+
+
 # -- parse_uri
 
 
@@ -245,3 +370,27 @@ def test_process_link_mshta_script():
     assert "mshta" in heur.signatures
     assert "T1218.005" in heur.attack_ids
     assert "9859550f.mshta_javascript" in ole._extracted_files
+
+
+def test_check_for_macros_cache(monkeypatch, tmp_path):
+    sample = tmp_path / "sample.doc"
+    sample.write_bytes(b"sample")
+    macros = [("Sub A()\nEnd Sub", "a" * 64), ("Sub B()\nEnd Sub", "b" * 64)]
+    ole = Oletools()
+    calls = []
+    monkeypatch.setattr(
+        ole, "_parse_macros", lambda filename: calls.append(filename) or (True, ["pcode"], ["xlm"], macros, None)
+    )
+    states = []
+    for _ in range(2):
+        ole.macros, ole.macro_hashes, ole.xlm_macros, ole.pcode, ole.vba_stomping = [], {}, [], [], False
+        assert ole._check_for_macros(str(sample), "b" * 64) is None
+        states.append((ole.macros, ole.macro_hashes, ole.xlm_macros, ole.pcode, ole.vba_stomping))
+    # The second call is served from the cache and leaves the same state
+    assert calls == [str(sample)]
+    assert states[0] == states[1] == (["Sub A()\nEnd Sub"], {"Sub A()\nEnd Sub": "a" * 64}, ["xlm"], ["pcode"], True)
+    # Another file isn't served the cached results
+    other = tmp_path / "other.doc"
+    other.write_bytes(b"other")
+    ole._check_for_macros(str(other), "b" * 64)
+    assert calls == [str(sample), str(other)]